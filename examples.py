@@ -1,8 +1,10 @@
 from pathlib import Path
 
+import pytest
 from fontTools.feaLib.ast import BaseAxis, TableBlock
 
 from tptq.feacomposer import FeaComposer
+from tptq.feacomposer.utils import GlyphNameProcessingParser
 
 reference = (Path.cwd() / "examples.fea").read_text()
 
@@ -34,7 +36,8 @@ def test() -> None:
             "UseMarkFilteringSet": c.glyphClass(["virama"]),
         },
     ):
-        c.sub("ka", "virama", "ra", by="kRa")
+        rule = c.sub("ka", "virama", "ra", by="kRa")
+        assert c.sub("ka", "virama", "ra", by="kRa") is rule
 
     with c.Lookup(feature="half"):
         for onset in ["k", "th", "dh", "r", "kR"]:
@@ -59,6 +62,26 @@ def test() -> None:
             by=None,
         )
 
+    with c.Lookup(feature="salt") as lookupSalt:
+        c.subAlternate("ka", alternates=c.glyphClass(["ka.alt1", "ka.alt2"]))
+    assert c.lookupReference(lookupSalt, "salt", dedup=True) is None
+
+    with c.Lookup(feature="ccmp"):
+        rule = c.sub("ka.ss01", by="ka")
+        c.sub("ka.ss02", by="ka")
+        decomposition = c.sub("kssa", by=["ka", "virama", "ssa"])
+        c.sub("kssa.ss01", by=["ka", "virama", "ssa"])
+
+    with c.Lookup(feature="akhn"):
+        c.subLigature("ka", "virama", "ssa", by="kssa")
+
+    with c.Lookup(feature="ccmp"):
+        c.subSingle("ka.ss03", by="ka")
+        c.subMultiple("kssa.ss02", by=["ka", "virama", "ssa"])
+
+    assert rule.asFea() == "sub ka-deva.ss01 by ka-deva;"
+    assert decomposition.asFea() == "sub kssa-deva by ka-deva virama-deva ssa-deva;"
+
     table = TableBlock("BASE")
     table.statements.append(
         BaseAxis(
@@ -72,6 +95,66 @@ def test() -> None:
     assert c.asFeatureFile().asFea() == reference
 
 
+def testUnmergedSubstitutions() -> None:
+    c = FeaComposer(
+        languageSystems={},
+        mergeSubstitutions=False,
+    )
+
+    with c.Lookup():
+        for variant in ["a.ss01", "a.ss02"]:
+            c.sub(variant, by="a")
+        for ligature in ["ae", "ae.ss01"]:
+            c.sub(ligature, by=["a", "e"])
+
+    assert c.asFeatureFile().asFea() == (
+        "lookup _1 {\n"
+        "    lookupflag 0;\n"
+        "    sub a.ss01 by a;\n"
+        "    sub a.ss02 by a;\n"
+        "    sub ae by a e;\n"
+        "    sub ae.ss01 by a e;\n"
+        "} _1;\n"
+    )
+
+
+def testLookupNames() -> None:
+    c = FeaComposer(languageSystems={})
+
+    with c.Lookup("_2"):
+        pass
+    with c.Lookup() as first:
+        pass
+    with c.Lookup() as second:
+        pass
+    assert (first.name, second.name) == ("_1", "_3")
+
+    with pytest.raises(AssertionError):
+        with c.Lookup("_1"):
+            pass
+
+
+def testGlyphNameProcessingParser() -> None:
+    processed = list[str]()
+
+    def processor(name: str) -> str:
+        processed.append(name)
+        return insertNamespace(name)
+
+    code = "feature liga { sub f f i by f_f_i; sub f i by f_i; } liga;"
+
+    featureFile = GlyphNameProcessingParser(code, processor).parse()
+    assert "sub f-deva f-deva i-deva by f_f_i-deva;" in featureFile.asFea()
+    assert processed == ["f", "i", "f_f_i", "f_i"]
+
+    processed.clear()
+    processedNames = dict[str, str]()
+    for _ in range(2):
+        GlyphNameProcessingParser(code, processor, processedNames=processedNames).parse()
+    assert processed == ["f", "i", "f_f_i", "f_i"]
+    assert processedNames["f_i"] == "f_i-deva"
+
+
 def insertNamespace(name: str) -> str:
     head, sep, tail = name.partition(".")
     return head + "-deva" + sep + tail
@@ -1,7 +1,7 @@
-from collections.abc import Callable, Iterable, Iterator
+from collections.abc import Callable, Hashable, Iterable, Iterator, Sequence
 from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import TypedDict, overload
+from typing import Literal, TypedDict, overload
 
 from fontTools.feaLib import ast
 from fontTools.feaLib.lexer import Lexer
@@ -18,8 +18,17 @@ NormalizedAnyGlyphClass = ast.GlyphClass | ast.GlyphClassName
 AnyGlyph = str | AnyGlyphClass
 NormalizedAnyGlyph = ast.GlyphName | NormalizedAnyGlyphClass
 
+SubstitutionStatement = (
+    ast.SingleSubstStatement
+    | ast.MultipleSubstStatement
+    | ast.LigatureSubstStatement
+    | ast.AlternateSubstStatement
+    | ast.ChainContextSubstStatement
+    | ast.IgnoreSubstStatement
+)
 
-@dataclass
+
+@dataclass(slots=True)
 class ContextualInput:
     glyph: NormalizedAnyGlyph
     lookups: list[ast.LookupBlock]
@@ -34,29 +43,52 @@ class LookupFlagDict(TypedDict, total=False):
     UseMarkFilteringSet: AnyGlyphClass | None
 
 
-@dataclass
+@dataclass(slots=True)
 class FeaComposer:
     languageSystems: LanguageSystemDict
     glyphNameProcessor: StringProcessor
-    """Every incoming glyph name is processed with this function. Often useful for renaming glyphs. For example, supply `lambda name: "Deva:" + name` to prefix all glyph names with the Devanagari namespace."""
+    """Every incoming glyph name is processed with this function. Often useful for renaming glyphs. For example, supply `lambda name: "Deva:" + name` to prefix all glyph names with the Devanagari namespace. The result for each name is cached until another function is assigned, so the function is expected to be pure."""
+    mergeSubstitutions: bool
+    """Whether adjacent single or multiple substitutions with the same output are merged into one rule with a glyph class as its input when their lookup block closes. Turn this off if a tool downstream needs one rule per input glyph, or if the statements returned by `sub` are used after the block closes."""
 
     root: list[ast.Element]
     current: list[ast.Element]
     nextLookupNumber: int
 
+    _lookupNames: set[str]
+    _featureLookups: set[tuple[str, tuple[str, str] | None, str]]
+    _glyphNames: dict[str, ast.GlyphName]
+    _glyphNamesProcessor: StringProcessor
+    _glyphClassNames: dict[ast.GlyphClassDefinition, ast.GlyphClassName]
+    _lookupFlagStatements: dict[int, ast.LookupFlagStatement]
+    _substitutionStatements: dict[
+        int,
+        tuple[list[ast.Element], dict[Hashable, SubstitutionStatement]],
+    ]
+
     def __init__(
         self,
         *,
         languageSystems: LanguageSystemDict,
         glyphNameProcessor: StringProcessor = lambda name: name,
+        mergeSubstitutions: bool = True,
     ) -> None:
         self.languageSystems = languageSystems
         self.glyphNameProcessor = glyphNameProcessor
+        self.mergeSubstitutions = mergeSubstitutions
 
         self.root = list[ast.Element]()
         self.current = self.root
         self.nextLookupNumber = 1
 
+        self._lookupNames = set[str]()
+        self._featureLookups = set[tuple[str, tuple[str, str] | None, str]]()
+        self._glyphNames = {}
+        self._glyphNamesProcessor = glyphNameProcessor
+        self._glyphClassNames = {}
+        self._lookupFlagStatements = {}
+        self._substitutionStatements = {}
+
     def languageSystemStatements(self) -> list[ast.LanguageSystemStatement]:
         return [
             ast.LanguageSystemStatement(k, v)
@@ -120,26 +152,47 @@ class FeaComposer:
         feature: str = "",
         flags: LookupFlagDict | None = None,
     ) -> Iterator[ast.LookupBlock]:
+        """With `mergeSubstitutions`, adjacent single or multiple substitutions with the same output are merged into one rule when the block closes, replacing the statements that `sub` returned for them."""
         if not name:
-            name = f"_{self.nextLookupNumber}"
+            # Numbered names that were taken explicitly are skipped:
+            while (name := f"_{self.nextLookupNumber}") in self._lookupNames:
+                self.nextLookupNumber += 1
             self.nextLookupNumber += 1
+        assert name not in self._lookupNames, name
+        self._lookupNames.add(name)
         lookupBlock = ast.LookupBlock(name)
-        flags = flags or {}
-        lookupBlock.statements.append(
-            ast.LookupFlagStatement(
-                sum(_LOOKUP_FLAG_NAME_TO_MASK.get(k, 0) for k, v in flags.items() if v),
-                markAttachment=self._normalized(flags.get("MarkAttachmentType")),
-                markFilteringSet=self._normalized(flags.get("UseMarkFilteringSet")),
-            )
-        )
+        lookupBlock.statements.append(self._lookupFlagStatement(flags or {}))
         self._addLookup(lookupBlock, feature, languageSystems)
 
         backup = self.current
         self.current = lookupBlock.statements
         try:
             yield lookupBlock
+            if self.mergeSubstitutions:
+                lookupBlock.statements[:] = _mergedSubstitutions(lookupBlock.statements)
         finally:
             self.current = backup
+            self._substitutionStatements.pop(id(lookupBlock.statements), None)
+
+    @overload
+    def lookupReference(
+        self,
+        lookup: ast.LookupBlock,
+        feature: str,
+        *,
+        languageSystems: LanguageSystemDict | None = None,
+        dedup: Literal[False] = False,
+    ) -> ast.LookupReferenceStatement: ...
+
+    @overload
+    def lookupReference(
+        self,
+        lookup: ast.LookupBlock,
+        feature: str,
+        *,
+        languageSystems: LanguageSystemDict | None = None,
+        dedup: bool,
+    ) -> ast.LookupReferenceStatement | None: ...
 
     def lookupReference(
         self,
@@ -147,9 +200,12 @@ class FeaComposer:
         feature: str,
         *,
         languageSystems: LanguageSystemDict | None = None,
-    ) -> ast.LookupReferenceStatement:
+        dedup: bool = False,
+    ) -> ast.LookupReferenceStatement | None:
+        """With `dedup`, language systems under which the lookup is already registered for the feature are skipped, and `None` is returned if that leaves none."""
         reference = ast.LookupReferenceStatement(lookup)
-        self._addLookup(reference, feature, languageSystems)
+        if not self._addLookup(reference, feature, languageSystems, dedup=dedup):
+            return None
         return reference
 
     # Substitution statements:
@@ -158,80 +214,118 @@ class FeaComposer:
         self,
         *glyphs: AnyGlyph | ContextualInput,
         by: AnyGlyph | Iterable[str] | None,
-    ) -> (
-        ast.SingleSubstStatement
-        | ast.MultipleSubstStatement
-        | ast.LigatureSubstStatement
-        | ast.ChainContextSubstStatement
-        | ast.IgnoreSubstStatement
-    ):
+    ) -> SubstitutionStatement:
+        """Identical rules in the same block are only added once; repeating one returns the existing statement. With `mergeSubstitutions`, the returned statement may be replaced by a merged one when its lookup block closes."""
         prefix = list[NormalizedAnyGlyph]()
         input = list[NormalizedAnyGlyph]()
         lookupLists = list[list[ast.LookupBlock]]()
         suffix = list[NormalizedAnyGlyph]()
+        normalized = self._normalized
         for item in glyphs:
             if isinstance(item, ContextualInput):
                 assert not suffix, glyphs
                 input.append(item.glyph)
                 lookupLists.append(item.lookups)
             elif input:
-                suffix.append(self._normalized(item))
+                suffix.append(normalized(item))
             else:
-                prefix.append(self._normalized(item))
+                prefix.append(normalized(item))
 
         if by is None:
             assert input, glyphs
-            if any(lookupLists):
-                statement = ast.ChainContextSubstStatement(
-                    prefix=prefix,
-                    glyphs=input,
-                    suffix=suffix,
-                    lookups=[i or None for i in lookupLists],
-                )
-            else:
-                statement = ast.IgnoreSubstStatement([(prefix, input, suffix)])
-        else:
-            assert not any(lookupLists), (glyphs, by)
-            if input:
-                forceChain = True
-            else:
-                input = prefix
-                prefix = []
-                forceChain = False
-            output = (
-                self._normalized(by)
-                if isinstance(by, AnyGlyph)
-                else [self._normalized(i) for i in by]
+            backtrack = prefix or _EMPTY
+            lookahead = suffix or _EMPTY
+            signature = (
+                _signatures(backtrack),
+                _signatures(input),
+                _signatures(lookahead),
+                tuple(map(tuple, lookupLists)),
             )
-            if len(input) == 1:
-                if isinstance(output, list):
-                    assert isinstance(input[0], ast.GlyphName)
-                    statement = ast.MultipleSubstStatement(
-                        prefix=prefix,
-                        glyph=input[0],
-                        suffix=suffix,
-                        replacement=output,
-                        forceChain=forceChain,
-                    )
-                else:
-                    statement = ast.SingleSubstStatement(
+            statement = self._existingSubstitution(signature)
+            if statement is None:
+                if any(lookupLists):
+                    statement = ast.ChainContextSubstStatement(
+                        prefix=backtrack,
                         glyphs=input,
-                        replace=[output],
-                        prefix=prefix,
-                        suffix=suffix,
-                        forceChain=forceChain,
+                        suffix=lookahead,
+                        lookups=tuple(i or None for i in lookupLists),
                     )
+                else:
+                    statement = ast.IgnoreSubstStatement([(backtrack, input, lookahead)])
+                self._addSubstitution(signature, statement)
+            return statement
+
+        assert not any(lookupLists), (glyphs, by)
+        if input:
+            backtrack = prefix or _EMPTY
+            lookahead = suffix or _EMPTY
+            forceChain = True
+        else:
+            input = prefix
+            backtrack = lookahead = _EMPTY
+            forceChain = False
+        if isinstance(by, _ANY_GLYPH_TYPES):
+            output = normalized(by)
+            if len(input) == 1:
+                return self._singleSubst(backtrack, input[0], lookahead, output, forceChain)
             else:
                 assert isinstance(output, ast.GlyphName)
-                statement = ast.LigatureSubstStatement(
-                    prefix=prefix,
-                    glyphs=input,
-                    suffix=suffix,
-                    replacement=output,
-                    forceChain=forceChain,
-                )
+                return self._ligatureSubst(backtrack, input, lookahead, output, forceChain)
+        else:
+            assert len(input) == 1 and isinstance(input[0], ast.GlyphName), (glyphs, by)
+            output = [normalized(i) for i in by]
+            return self._multipleSubst(backtrack, input[0], lookahead, output, forceChain)
 
-        self.current.append(statement)
+    def subSingle(
+        self,
+        glyph: AnyGlyph,
+        *,
+        by: AnyGlyph,
+    ) -> ast.SingleSubstStatement:
+        """Same as `sub(glyph, by=by)`, without the dispatch on the rule type."""
+        return self._singleSubst(
+            _EMPTY, self._normalized(glyph), _EMPTY, self._normalized(by), False
+        )
+
+    def subMultiple(
+        self,
+        glyph: str,
+        *,
+        by: Iterable[str],
+    ) -> ast.MultipleSubstStatement:
+        """Same as `sub(glyph, by=by)` with a sequence as `by`, without the dispatch on the rule type."""
+        assert not isinstance(by, str), by
+        return self._multipleSubst(
+            _EMPTY, self._normalized(glyph), _EMPTY, [self._normalized(i) for i in by], False
+        )
+
+    def subLigature(
+        self,
+        *glyphs: AnyGlyph,
+        by: str,
+    ) -> ast.LigatureSubstStatement:
+        """Same as `sub(*glyphs, by=by)` with several glyphs, without the dispatch on the rule type."""
+        assert len(glyphs) > 1, glyphs
+        return self._ligatureSubst(
+            _EMPTY, [self._normalized(i) for i in glyphs], _EMPTY, self._normalized(by), False
+        )
+
+    def subAlternate(
+        self,
+        glyph: str,
+        *,
+        alternates: AnyGlyphClass,
+    ) -> ast.AlternateSubstStatement:
+        """Writes `sub glyph from alternates;`."""
+        assert not isinstance(alternates, str), alternates
+        input = self._normalized(glyph)
+        output = self._normalized(alternates)
+        signature = (ast.AlternateSubstStatement, _signature(input), _signature(output))
+        statement = self._existingSubstitution(signature)
+        if statement is None:
+            statement = ast.AlternateSubstStatement(_EMPTY, input, _EMPTY, output)
+            self._addSubstitution(signature, statement)
+        assert isinstance(statement, ast.AlternateSubstStatement)
         return statement
 
     # Internal:
@@ -250,18 +344,154 @@ class FeaComposer:
 
     def _normalized(self, glyph: AnyGlyph | None) -> NormalizedAnyGlyph | None:
         if isinstance(glyph, str):
-            assert not glyph.startswith("@") and " " not in glyph, glyph
-            return ast.GlyphName(self.glyphNameProcessor(glyph))
+            if self._glyphNamesProcessor is not self.glyphNameProcessor:
+                self._glyphNames = {}
+                self._glyphNamesProcessor = self.glyphNameProcessor
+            glyphName = self._glyphNames.get(glyph)
+            if glyphName is None:
+                assert not glyph.startswith("@") and " " not in glyph, glyph
+                glyphName = ast.GlyphName(self.glyphNameProcessor(glyph))
+                self._glyphNames[glyph] = glyphName
+            return glyphName
         elif isinstance(glyph, ast.GlyphClassDefinition):
-            return ast.GlyphClassName(glyph)
+            glyphClassName = self._glyphClassNames.get(glyph)
+            if glyphClassName is None:
+                glyphClassName = ast.GlyphClassName(glyph)
+                self._glyphClassNames[glyph] = glyphClassName
+            return glyphClassName
         else:
             return glyph
 
+    def _singleSubst(
+        self,
+        prefix: Sequence[NormalizedAnyGlyph],
+        glyph: NormalizedAnyGlyph,
+        suffix: Sequence[NormalizedAnyGlyph],
+        replacement: NormalizedAnyGlyph,
+        forceChain: bool,
+    ) -> ast.SingleSubstStatement:
+        signature = (
+            ast.SingleSubstStatement,
+            _signatures(prefix),
+            _signature(glyph),
+            _signatures(suffix),
+            forceChain,
+            _signature(replacement),
+        )
+        statement = self._existingSubstitution(signature)
+        if statement is None:
+            statement = ast.SingleSubstStatement(
+                glyphs=[glyph],
+                replace=(replacement,),
+                prefix=prefix,
+                suffix=suffix,
+                forceChain=forceChain,
+            )
+            self._addSubstitution(signature, statement)
+        assert isinstance(statement, ast.SingleSubstStatement)
+        return statement
+
+    def _multipleSubst(
+        self,
+        prefix: Sequence[NormalizedAnyGlyph],
+        glyph: ast.GlyphName,
+        suffix: Sequence[NormalizedAnyGlyph],
+        replacement: Sequence[NormalizedAnyGlyph],
+        forceChain: bool,
+    ) -> ast.MultipleSubstStatement:
+        signature = (
+            ast.MultipleSubstStatement,
+            _signatures(prefix),
+            _signature(glyph),
+            _signatures(suffix),
+            forceChain,
+            _signatures(replacement),
+        )
+        statement = self._existingSubstitution(signature)
+        if statement is None:
+            statement = ast.MultipleSubstStatement(
+                prefix=prefix,
+                glyph=glyph,
+                suffix=suffix,
+                replacement=replacement,
+                forceChain=forceChain,
+            )
+            self._addSubstitution(signature, statement)
+        assert isinstance(statement, ast.MultipleSubstStatement)
+        return statement
+
+    def _ligatureSubst(
+        self,
+        prefix: Sequence[NormalizedAnyGlyph],
+        glyphs: Sequence[NormalizedAnyGlyph],
+        suffix: Sequence[NormalizedAnyGlyph],
+        replacement: ast.GlyphName,
+        forceChain: bool,
+    ) -> ast.LigatureSubstStatement:
+        signature = (
+            ast.LigatureSubstStatement,
+            _signatures(prefix),
+            _signatures(glyphs),
+            _signatures(suffix),
+            forceChain,
+            _signature(replacement),
+        )
+        statement = self._existingSubstitution(signature)
+        if statement is None:
+            statement = ast.LigatureSubstStatement(
+                prefix=prefix,
+                glyphs=glyphs,
+                suffix=suffix,
+                replacement=replacement,
+                forceChain=forceChain,
+            )
+            self._addSubstitution(signature, statement)
+        assert isinstance(statement, ast.LigatureSubstStatement)
+        return statement
+
+    def _existingSubstitution(
+        self,
+        signature: Hashable,
+    ) -> SubstitutionStatement | None:
+        entry = self._substitutionStatements.get(id(self.current))
+        return None if entry is None else entry[1].get(signature)
+
+    def _addSubstitution(
+        self,
+        signature: Hashable,
+        statement: SubstitutionStatement,
+    ) -> None:
+        # Keyed by the identity of the block, which is kept alive so that its id is not reused:
+        entry = self._substitutionStatements.get(id(self.current))
+        if entry is None:
+            entry = self._substitutionStatements[id(self.current)] = self.current, {}
+        entry[1][signature] = statement
+        self.current.append(statement)
+
+    def _lookupFlagStatement(
+        self,
+        flags: LookupFlagDict,
+    ) -> ast.LookupFlagStatement:
+        value = sum(_LOOKUP_FLAG_NAME_TO_MASK.get(k, 0) for k, v in flags.items() if v)
+        markAttachment = self._normalized(flags.get("MarkAttachmentType"))
+        markFilteringSet = self._normalized(flags.get("UseMarkFilteringSet"))
+        if markAttachment is not None or markFilteringSet is not None:
+            return ast.LookupFlagStatement(
+                value,
+                markAttachment=markAttachment,
+                markFilteringSet=markFilteringSet,
+            )
+
+        # Without glyph classes, a statement is fully described by its value and can be shared, as feaLib never mutates it:
+        statement = self._lookupFlagStatements.get(value)
+        if statement is None:
+            statement = self._lookupFlagStatements[value] = ast.LookupFlagStatement(value)
+        return statement
+
     def _normalizedLanguageSystems(
         self,
         languageSystems: LanguageSystemDict,
-    ) -> list[tuple[str, str]]:
-        normalized = list[tuple[str, str]]()
+    ) -> Iterator[tuple[str, str]]:
         for script, languages in sorted(
             languageSystems.items(),
             key=lambda x: "" if x == DEFAULT_SCRIPT_TAG else x,
@@ -272,33 +502,137 @@ class FeaComposer:
                 key=lambda x: "" if x == DEFAULT_LANGUAGE_TAG else x,
             ):
                 assert language in self.languageSystems[script], (script, language)
-                normalized.append((script, language))
-        return normalized
+                yield script, language
 
     def _addLookup(
         self,
         lookup: ast.LookupBlock | ast.LookupReferenceStatement,
         feature: str,
         languageSystems: LanguageSystemDict | None,
-    ) -> None:
+        *,
+        dedup: bool = False,
+    ) -> bool:
+        """Returns whether the lookup was added anywhere."""
         if feature:
             assert len(feature) == 4, feature
-            for languageSystem in self._normalizedLanguageSystems(
-                languageSystems or self.languageSystems
-            ) or [None]:
+            featureBlocks = list[ast.FeatureBlock]()
+            name = lookup.name if isinstance(lookup, ast.LookupBlock) else lookup.lookup.name
+            languageSystems = languageSystems or self.languageSystems
+            for languageSystem in (
+                self._normalizedLanguageSystems(languageSystems) if languageSystems else [None]
+            ):
+                key = feature, languageSystem, name
+                if dedup and key in self._featureLookups:
+                    continue
+                self._featureLookups.add(key)
                 featureBlock = ast.FeatureBlock(feature)
                 if languageSystem:
                     script, language = languageSystem
-                    featureBlock.statements.append(ast.ScriptStatement(script))
-                    featureBlock.statements.append(ast.LanguageStatement(language))
-                featureBlock.statements.append(lookup)
-                self.current.append(featureBlock)
+                    featureBlock.statements = [
+                        ast.ScriptStatement(script),
+                        ast.LanguageStatement(language),
+                        lookup,
+                    ]
+                else:
+                    featureBlock.statements = [lookup]
+                featureBlocks.append(featureBlock)
                 if isinstance(lookup, ast.LookupBlock):
                     lookup = ast.LookupReferenceStatement(lookup)
+            self.current.extend(featureBlocks)
+            return bool(featureBlocks)
         else:
             assert isinstance(lookup, ast.LookupBlock), lookup
             assert not languageSystems, languageSystems
             self.current.append(lookup)
+            return True
+
+
+def _signature(glyph: NormalizedAnyGlyph | None) -> Hashable:
+    """A hashable value that is equal for glyphs written identically in FEA."""
+    if isinstance(glyph, ast.GlyphName):
+        return glyph.glyph
+    elif isinstance(glyph, ast.GlyphClass):
+        return ast.GlyphClass, _signatures(glyph.glyphs)
+    elif isinstance(glyph, ast.GlyphClassName):
+        return glyph.glyphclass
+    else:
+        return glyph
+
+
+def _signatures(glyphs: Sequence[NormalizedAnyGlyph]) -> tuple[Hashable, ...]:
+    return tuple(_signature(i) for i in glyphs)
+
+
+def _mergedSubstitutions(
+    statements: list[ast.Element],
+) -> list[ast.Element]:
+    """Adjacent single or multiple substitutions that only differ in their input are replaced by a new rule with a glyph class as its input, e.g. `sub a by x; sub b by x;` becomes `sub [a b] by x;` and `sub a by x y; sub b by x y;` becomes `sub [a b] by x y;`. The merged statements themselves are left untouched."""
+    merged = list[ast.Element]()
+    mergedInput: ast.GlyphClass | None = None
+    previousKey = None
+    for statement in statements:
+        key = _mergeKey(statement)
+        if key is not None and key == previousKey:
+            previous = merged[-1]
+            if mergedInput is None:
+                mergedInput = ast.GlyphClass(_members(_mergeableInput(previous)))
+                if isinstance(previous, ast.SingleSubstStatement):
+                    merged[-1] = ast.SingleSubstStatement(
+                        glyphs=[mergedInput],
+                        replace=previous.replacements,
+                        prefix=previous.prefix,
+                        suffix=previous.suffix,
+                        forceChain=previous.forceChain,
+                    )
+                else:
+                    assert isinstance(previous, ast.MultipleSubstStatement)
+                    merged[-1] = ast.MultipleSubstStatement(
+                        prefix=previous.prefix,
+                        glyph=mergedInput,
+                        suffix=previous.suffix,
+                        replacement=previous.replacement,
+                        forceChain=previous.forceChain,
+                    )
+            mergedInput.extend(_members(_mergeableInput(statement)))
+        else:
+            merged.append(statement)
+            mergedInput = None
+        previousKey = key
+    return merged
+
+
+def _mergeKey(statement: ast.Element) -> Hashable:
+    if isinstance(statement, ast.SingleSubstStatement):
+        if len(statement.glyphs) != 1 or len(statement.replacements) != 1:
+            return None
+        outputs = statement.replacements
+    elif isinstance(statement, ast.MultipleSubstStatement):
+        outputs = statement.replacement
+    else:
+        return None
+    if not isinstance(_mergeableInput(statement), (ast.GlyphName, ast.GlyphClass)):
+        return None
+    if not all(isinstance(i, ast.GlyphName) for i in outputs):
+        return None
+    return (
+        type(statement),
+        _signatures(statement.prefix),
+        _signatures(statement.suffix),
+        statement.forceChain,
+        _signatures(outputs),
+    )
+
+
+def _mergeableInput(statement: ast.Element) -> NormalizedAnyGlyph:
+    if isinstance(statement, ast.SingleSubstStatement):
+        return statement.glyphs[0]
+    else:
+        assert isinstance(statement, ast.MultipleSubstStatement)
+        return statement.glyph
+
+
+def _members(glyph: NormalizedAnyGlyph) -> list[NormalizedAnyGlyph]:
+    return [*glyph.glyphs] if isinstance(glyph, ast.GlyphClass) else [glyph]
 
 
 _LOOKUP_FLAG_NAME_TO_MASK = {
@@ -307,3 +641,9 @@ _LOOKUP_FLAG_NAME_TO_MASK = {
     "IgnoreLigatures": 0x0004,
     "IgnoreMarks": 0x0008,
 }
+
+# Same as AnyGlyph, but a tuple is faster to check with isinstance() than a union:
+_ANY_GLYPH_TYPES = (str, ast.GlyphClass, ast.GlyphClassDefinition)
+
+# Shared by statements without some or all context, as feaLib only ever iterates these sequences:
+_EMPTY = ()
@@ -13,11 +13,15 @@ from . import StringProcessor
 
 class GlyphNameProcessingParser(Parser):
     """
-    All glyph names go through the `processor` function during parsing, before the returned new name is validated against the optional set of `newNames`.
+    All glyph names go through the `processor` function during parsing, before the returned new name is validated against the optional set of `newNames`. The result for each name is cached, so the function is expected to be pure.
+
+    By default, each parser has a cache of its own. Pass the same dict as `processedNames` to share it between parsers.
     """
 
     processor: StringProcessor
 
+    _processedNames: dict[str, str]
+
     def __init__(
         self,
         code: str | IO[str],
@@ -26,6 +30,7 @@ class GlyphNameProcessingParser(Parser):
         newNames: Iterable[str] = (),
         followIncludes: bool = True,
         includeDir: Path | None = None,
+        processedNames: dict[str, str] | None = None,
     ) -> None:
         with StringIO(code) if isinstance(code, str) else code as f:
             super().__init__(
@@ -35,10 +40,15 @@ class GlyphNameProcessingParser(Parser):
                 includeDir=includeDir,
             )
         self.processor = processor
+        self._processedNames = {} if processedNames is None else processedNames
 
     def expect_glyph_(self) -> str:
-        glyph = super().expect_glyph_()
+        # Calling the base method directly avoids creating a super() proxy per token:
+        glyph = Parser.expect_glyph_(self)
         if self.cur_token_type_ is Lexer.NAME:
-            return self.processor(glyph)
+            processed = self._processedNames.get(glyph)
+            if processed is None:
+                processed = self._processedNames[glyph] = self.processor(glyph)
+            return processed
         else:
             return glyph